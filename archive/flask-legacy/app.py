@@ -1,10 +1,21 @@
 import csv
-import io
+import hashlib
+import math
 import os
-from typing import Dict, List, Sequence
-
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import orjson
 import requests
+from diskcache import Cache
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import (
     Flask,
     Response,
@@ -90,14 +101,142 @@ FIELD_OPTIONS: Dict[str, str] = {
     "custom_url": "Custom URL",
 }
 
+# Product sub-resource each export field depends on, used to trim the
+# products request's include list to what the selected fields actually read.
+FIELD_INCLUDES: Dict[str, str] = {
+    "image_urls": "images",
+    "primary_image_url": "primary_image",
+    "thumbnail_url": "primary_image",
+    "custom_fields": "custom_fields",
+}
 
-def get_bigcommerce_config(overrides: Dict[str, str] | None = None) -> Dict[str, str]:
-    """Read required configuration from environment variables and optional overrides."""
-    config = {
+# Fields populated from the per-product variants endpoint.
+VARIANT_FIELDS = frozenset({"variant_skus", "variant_prices", "variants"})
+
+# Availability values (lowercased) that mark a product as unavailable.
+UNAVAILABLE_VALUES = frozenset({"disabled", "unavailable", "no", "false", "0"})
+
+# Number of product rows rendered in the /export preview table.
+PREVIEW_ROW_LIMIT = 50
+
+# Number of products encoded per csv.writer.writerows call.
+CSV_BATCH_SIZE = 256
+
+# Approximate size of each chunk written to the /download response stream.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Upper bound on concurrent page requests issued against the BigCommerce API.
+MAX_PAGE_WORKERS = 8
+
+# Shared HTTP session so paginated BigCommerce calls reuse pooled keep-alive
+# connections instead of paying a TCP/TLS handshake per page.
+SESSION = requests.Session()
+SESSION.headers.update(
+    {"Accept": "application/json", "Content-Type": "application/json"}
+)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            # Hand the final response back so callers can report the API error.
+            raise_on_status=False,
+        ),
+    ),
+)
+
+
+class _TokenBucket:
+    """Thread-safe token bucket that paces requests to a per-minute rate."""
+
+    def __init__(self, rate_per_minute: float, capacity: float) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Block until the requested number of tokens is available, then take them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.last_update) * self.rate
+                )
+                self.last_update = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# BigCommerce quotas count requests per store, so pace uncached API calls with
+# one bucket per store hash at BC_RPM (0 disables pacing). Each bucket holds one
+# pool's worth of requests so the first burst of concurrent pages goes out
+# immediately, and one tenant's large export never slows another store's.
+BC_RPM = float(os.getenv("BC_RPM", "300"))
+_RATE_LIMITERS: Dict[str, _TokenBucket] = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def _rate_limiter_for(store_hash: str) -> _TokenBucket | None:
+    """Return the token bucket for a store, creating it on first use."""
+    if BC_RPM <= 0:
+        return None
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.get(store_hash)
+        if limiter is None:
+            limiter = _RATE_LIMITERS[store_hash] = _TokenBucket(
+                BC_RPM, MAX_PAGE_WORKERS
+            )
+        return limiter
+
+# On-disk cache of raw BigCommerce page payloads so repeat exports (and the
+# /download that follows /export) skip the API. Entries are fresh for
+# BC_CACHE_TTL seconds; after that they are revalidated with If-None-Match and
+# kept for BC_CACHE_RETAIN seconds so an unchanged page costs only a 304, and a
+# failing upstream can fall back to the stale body. BC_CACHE_MODE is one of:
+#   enabled   - serve fresh hits, revalidate stale ones, store misses (default)
+#   read-only - serve fresh hits, revalidate stale ones, never store
+#   replay    - serve hits regardless of age, fail on a miss
+#   disabled  - always call the API
+CACHE_MODES = ("enabled", "read-only", "replay", "disabled")
+CACHE_MODE = os.getenv("BC_CACHE_MODE", "enabled").strip().lower()
+if CACHE_MODE not in CACHE_MODES:
+    CACHE_MODE = "enabled"
+CACHE_TTL_SECONDS = int(os.getenv("BC_CACHE_TTL", "60"))
+CACHE_RETAIN_SECONDS = max(
+    CACHE_TTL_SECONDS, int(os.getenv("BC_CACHE_RETAIN", str(24 * 60 * 60)))
+)
+# Upstream statuses for which a stale cached page is served instead of failing.
+CACHE_FALLBACK_STATUSES = frozenset({429, 500, 502, 503, 504})
+RESPONSE_CACHE = (
+    Cache(os.getenv("BC_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".bc_cache")))
+    if CACHE_MODE != "disabled"
+    else None
+)
+
+
+@lru_cache(maxsize=1)
+def _env_bigcommerce_config() -> Dict[str, str]:
+    """Read BigCommerce configuration from the environment once per process."""
+    return {
         "store_hash": os.getenv("BIGCOMMERCE_STORE_HASH", ""),
         "client_id": os.getenv("BIGCOMMERCE_CLIENT_ID", ""),
         "access_token": os.getenv("BIGCOMMERCE_ACCESS_TOKEN", ""),
     }
+
+
+def get_bigcommerce_config(overrides: Dict[str, str] | None = None) -> Dict[str, str]:
+    """Read required configuration from environment variables and optional overrides."""
+    config = dict(_env_bigcommerce_config())
     if overrides:
         for key, value in overrides.items():
             if value:
@@ -105,13 +244,142 @@ def get_bigcommerce_config(overrides: Dict[str, str] | None = None) -> Dict[str,
     return config
 
 
+def _cache_key(endpoint: str, headers: Dict[str, str], params: Dict) -> str:
+    """Key a page by store endpoint, query params and the credentials used."""
+    # Credentials are part of the key so one user's token never serves another's.
+    param_str = "&".join(f"{key}={params[key]}" for key in sorted(params))
+    raw = (
+        f"{headers.get('X-Auth-Client', '')}|{headers.get('X-Auth-Token', '')}|"
+        f"{endpoint}|{param_str}"
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _store_page(key: str, payload: Dict, etag: str) -> None:
+    """Write a page to the cache, fresh for CACHE_TTL_SECONDS."""
+    now = time.time()
+    RESPONSE_CACHE.set(
+        key,
+        {
+            "timestamp": now,
+            "stale_at": now + CACHE_TTL_SECONDS,
+            "etag": etag,
+            "body": payload,
+        },
+        expire=CACHE_RETAIN_SECONDS,
+    )
+
+
+def _get_page(
+    endpoint: str, headers: Dict[str, str], params: Dict, error_label: str
+) -> Dict:
+    """GET a single page from BigCommerce and return the decoded payload."""
+    key = ""
+    entry = None
+    request_headers = headers
+    if RESPONSE_CACHE is not None:
+        key = _cache_key(endpoint, headers, params)
+        entry = RESPONSE_CACHE.get(key)
+        if entry and (CACHE_MODE == "replay" or time.time() < entry["stale_at"]):
+            return entry["body"]
+        if CACHE_MODE == "replay":
+            raise RuntimeError(f"{error_label}: no cached response to replay for {endpoint}")
+        if entry and entry.get("etag"):
+            request_headers = {**headers, "If-None-Match": entry["etag"]}
+
+    # Endpoints look like https://api.bigcommerce.com/stores/<hash>/v3/...
+    store_hash = endpoint.split("/stores/", 1)[-1].split("/", 1)[0]
+    limiter = _rate_limiter_for(store_hash)
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        response = SESSION.get(
+            endpoint, headers=request_headers, params=params, timeout=30
+        )
+    except requests.RequestException:
+        if entry:
+            return entry["body"]
+        raise
+    if response.status_code == 304 and entry:
+        if CACHE_MODE == "enabled":
+            _store_page(key, entry["body"], entry["etag"])
+        return entry["body"]
+    if response.status_code != 200:
+        if entry and response.status_code in CACHE_FALLBACK_STATUSES:
+            return entry["body"]
+        raise RuntimeError(f"{error_label} ({response.status_code}): {response.text}")
+    payload = orjson.loads(response.content)
+    if RESPONSE_CACHE is not None and CACHE_MODE == "enabled":
+        _store_page(key, payload, response.headers.get("ETag", ""))
+    return payload
+
+
+def _fetch_all_pages(
+    endpoint: str,
+    headers: Dict[str, str],
+    params: Dict,
+    page_size: int,
+    error_label: str,
+    max_pages: int | None = None,
+    max_workers: int = MAX_PAGE_WORKERS,
+) -> List[Dict]:
+    """Fetch page 1, then the remaining pages concurrently once the total is known.
+
+    Pass max_workers=1 when the caller is already fanning out across threads, so
+    nested pools don't exceed the session's connection pool.
+    """
+
+    def get_page(page: int) -> Dict:
+        return _get_page(
+            endpoint, headers, {**params, "limit": page_size, "page": page}, error_label
+        )
+
+    payload = get_page(1)
+    data = payload.get("data", [])
+    results: List[Dict] = list(data)
+    if not data:
+        return results
+
+    pagination = (payload.get("meta") or {}).get("pagination") or {}
+    total_pages = pagination.get("total_pages")
+    if total_pages:
+        last_page = total_pages if max_pages is None else min(total_pages, max_pages)
+        pages = range(2, last_page + 1)
+        if len(pages) > 1 and max_workers > 1:
+            workers = min(max_workers, len(pages))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # map() preserves page order, so results match a sequential walk.
+                for page_payload in executor.map(get_page, pages):
+                    results.extend(page_payload.get("data", []))
+        else:
+            for page in pages:
+                results.extend(get_page(page).get("data", []))
+        return results
+
+    # No pagination metadata: walk pages sequentially until a short page.
+    page = 1
+    while len(data) >= page_size and (max_pages is None or page < max_pages):
+        page += 1
+        data = get_page(page).get("data", [])
+        results.extend(data)
+    return results
+
+
 def fetch_products(
     max_items: int = 2000,
     page_size: int = 250,
     include_variants: bool = False,
     config_override: Dict[str, str] | None = None,
+    include_unavailable: bool = True,
+    include_hidden: bool = True,
+    fields: Sequence[str] | None = None,
 ) -> List[Dict]:
-    """Fetch products from BigCommerce with pagination, up to max_items."""
+    """Fetch products from BigCommerce with pagination, up to max_items.
+
+    Unavailable or hidden products are dropped before variants are fetched, so
+    excluded products never cost a variants request. When fields is given, only
+    the sub-resources those fields read are requested.
+    """
     config = get_bigcommerce_config(config_override)
     missing = [key for key, value in config.items() if not value]
     if missing:
@@ -125,52 +393,55 @@ def fetch_products(
     headers = {
         "X-Auth-Client": config["client_id"],
         "X-Auth-Token": config["access_token"],
-        "Accept": "application/json",
-        "Content-Type": "application/json",
     }
     # Categories come back on the base product payload; requesting as a sub-resource
     # triggers 422 on some stores, so avoid adding it to includes.
-    include_params = ["images", "primary_image", "custom_fields"]
+    if fields is None:
+        include_params = ["images", "primary_image", "custom_fields"]
+    else:
+        include_params = [
+            include
+            for include in ("images", "primary_image", "custom_fields")
+            if any(FIELD_INCLUDES.get(field) == include for field in fields)
+        ]
+    if include_variants and fields is not None:
+        include_variants = any(field in VARIANT_FIELDS for field in fields)
     if include_variants:
         include_params.extend(["options", "modifiers"])
+    params = {"include": ",".join(include_params)} if include_params else {}
+
+    all_products = _fetch_all_pages(
+        endpoint,
+        headers,
+        params,
+        page_size,
+        "BigCommerce API error",
+        max_pages=math.ceil(max_items / page_size),
+    )
 
-    all_products: List[Dict] = []
-    page = 1
-    while len(all_products) < max_items:
-        params = {
-            "limit": page_size,
-            "page": page,
-            "include": ",".join(include_params),
-        }
-        response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-        if response.status_code != 200:
-            raise RuntimeError(
-                f"BigCommerce API error ({response.status_code}): {response.text}"
-            )
-        payload = response.json()
-        data = payload.get("data", [])
-        if not data:
-            break
-        all_products.extend(data)
-
-        pagination = (payload.get("meta") or {}).get("pagination") or {}
-        total_pages = pagination.get("total_pages")
-        current_page = pagination.get("current_page", page)
-        if total_pages and current_page >= total_pages:
-            break
-        if not total_pages and len(data) < page_size:
-            break
-        page += 1
-
-    products = all_products[:max_items]
+    del all_products[max_items:]
+    products = list(
+        iter_filtered(
+            all_products,
+            include_unavailable=include_unavailable,
+            include_hidden=include_hidden,
+        )
+    )
     if include_variants:
-        for product in products:
-            product_id = product.get("id")
-            if not product_id:
-                continue
-            product["variants"] = fetch_variants_for_product(
-                product_id, config_override=config_override
-            )
+        products_with_ids = [product for product in products if product.get("id")]
+        if products_with_ids:
+            workers = min(MAX_PAGE_WORKERS, len(products_with_ids))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                variant_lists = executor.map(
+                    # Products are already fetched in parallel, so each one
+                    # walks its variant pages sequentially.
+                    lambda product: fetch_variants_for_product(
+                        product["id"], config_override=config_override, max_workers=1
+                    ),
+                    products_with_ids,
+                )
+                for product, variants in zip(products_with_ids, variant_lists):
+                    product["variants"] = variants
 
     return products
 
@@ -179,6 +450,7 @@ def fetch_variants_for_product(
     product_id: int,
     config_override: Dict[str, str] | None = None,
     page_size: int = 250,
+    max_workers: int = MAX_PAGE_WORKERS,
 ) -> List[Dict]:
     """Fetch all variants for a single product with pagination."""
     config = get_bigcommerce_config(config_override)
@@ -187,52 +459,32 @@ def fetch_variants_for_product(
     headers = {
         "X-Auth-Client": config["client_id"],
         "X-Auth-Token": config["access_token"],
-        "Accept": "application/json",
-        "Content-Type": "application/json",
     }
-    variants: List[Dict] = []
-    page = 1
-    while True:
-        params = {"limit": page_size, "page": page}
-        response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-        if response.status_code != 200:
-            raise RuntimeError(
-                f"BigCommerce variants API error ({response.status_code}): {response.text}"
-            )
-        payload = response.json()
-        data = payload.get("data", [])
-        if not data:
-            break
-        variants.extend(data)
-
-        pagination = (payload.get("meta") or {}).get("pagination") or {}
-        total_pages = pagination.get("total_pages")
-        current_page = pagination.get("current_page", page)
-        if total_pages and current_page >= total_pages:
-            break
-        if not total_pages and len(data) < page_size:
-            break
-        page += 1
-
-    return variants
+    return _fetch_all_pages(
+        endpoint,
+        headers,
+        {},
+        page_size,
+        "BigCommerce variants API error",
+        max_workers=max_workers,
+    )
 
 
-def filter_products(
-    products: Sequence[Dict], include_unavailable: bool, include_hidden: bool
-) -> List[Dict]:
-    """Optionally drop unavailable or hidden products."""
-    unavailable_values = {"disabled", "unavailable", "no", "false", "0"}
-    filtered: List[Dict] = []
+def iter_filtered(
+    products: Iterable[Dict], include_unavailable: bool, include_hidden: bool
+) -> Iterator[Dict]:
+    """Optionally drop unavailable or hidden products, yielding the survivors."""
     for prod in products:
         prod = prod or {}
-        availability = str(prod.get("availability", "")).lower()
-        is_visible = prod.get("is_visible", True)
-        if not include_unavailable and availability in unavailable_values:
+        # Visibility is a plain flag, so test it before lowercasing availability.
+        if not include_hidden and not prod.get("is_visible", True):
             continue
-        if not include_hidden and not is_visible:
+        if (
+            not include_unavailable
+            and str(prod.get("availability", "")).lower() in UNAVAILABLE_VALUES
+        ):
             continue
-        filtered.append(prod)
-    return filtered
+        yield prod
 
 
 def fetch_brand_map(config_override: Dict[str, str] | None = None) -> Dict[int, str]:
@@ -249,107 +501,282 @@ def fetch_brand_map(config_override: Dict[str, str] | None = None) -> Dict[int,
     headers = {
         "X-Auth-Client": config["client_id"],
         "X-Auth-Token": config["access_token"],
-        "Accept": "application/json",
-        "Content-Type": "application/json",
     }
     brand_map: Dict[int, str] = {}
-    page = 1
-    while True:
-        params = {"limit": 250, "page": page}
-        response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-        if response.status_code != 200:
-            raise RuntimeError(
-                f"BigCommerce brand API error ({response.status_code}): {response.text}"
-            )
-        payload = response.json()
-        data = payload.get("data", [])
-        if not data:
-            break
-        for brand in data:
-            brand_map[brand.get("id")] = brand.get("name", "")
-        if len(data) < 250:
-            break
-        page += 1
+    brands = _fetch_all_pages(endpoint, headers, {}, 250, "BigCommerce brand API error")
+    for brand in brands:
+        brand_map[brand.get("id")] = brand.get("name", "")
     return brand_map
 
 
-def build_csv_rows(
+class _LineSink:
+    """File-like sink that collects the lines csv.writer emits until drained."""
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+
+    def write(self, value: str) -> None:
+        self.lines.append(value)
+
+    def drain(self) -> str:
+        text = "".join(self.lines)
+        self.lines = []
+        return text
+
+
+def _batched(items: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most size items."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _buffered(lines: Iterable[str], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Coalesce small CSV lines into larger chunks before handing them to WSGI."""
+    pending: List[str] = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield "".join(pending)
+
+
+def _gzip_stream(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Gzip-encode text chunks on the fly for a streamed response."""
+    # wbits=31 selects the gzip container rather than a raw zlib stream.
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _apply_domain(domain: str | None, url_value: str) -> str:
+    """Prefix a relative URL with domain, which must have no trailing slash.
+
+    None means no custom domain; an empty string is a domain that was only
+    slashes, which still roots relative URLs at "/".
+    """
+    if domain is None:
+        return url_value
+    if not url_value:
+        return ""
+    if url_value.startswith(("http://", "https://")):
+        return url_value
+    path = url_value if url_value.startswith("/") else f"/{url_value}"
+    return f"{domain}{path}"
+
+
+def _custom_fields_value(custom_fields: List[Dict]) -> str:
+    parts = []
+    for cf in custom_fields:
+        name = cf.get("name", "")
+        cf_value = cf.get("value", "")
+        parts.append(f"{name}: {cf_value}" if name else cf_value)
+    return "; ".join(parts)
+
+
+def _custom_url_value(
+    product: Dict, brand_map: Dict[int, str], custom_domain: str | None
+) -> str:
+    custom = product.get("custom_url") or {}
+    if isinstance(custom, dict):
+        raw_url = custom.get("url", "") or custom.get("path", "") or ""
+    else:
+        raw_url = str(custom)
+    return _apply_domain(custom_domain, raw_url)
+
+
+def _flatten_value(value):
+    """Join lists and serialize dicts as JSON; other values pass through."""
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return orjson.dumps(value).decode()
+    return value
+
+
+def _default_column(
+    field: str,
+    batch: List[Dict],
+    shared: Dict[str, List],
+    brand_map: Dict[int, str],
+    custom_domain: str | None,
+) -> List:
+    """Plain product attribute for each product in the batch."""
+    column = [product.get(field, "") for product in batch]
+    # Most attributes are scalars; only walk the column again when it holds
+    # lists or dicts that need flattening.
+    value_types = set(map(type, column))
+    if list in value_types or dict in value_types:
+        column = [_flatten_value(value) for value in column]
+    return column
+
+
+def _hoisted_column(
+    batch: List[Dict], shared: Dict[str, List], key: str, empty_factory: type
+) -> List:
+    """Column of product[key] (or an empty container), built once per batch."""
+    column = shared.get(key)
+    if column is None:
+        empty = empty_factory()
+        column = shared[key] = [product.get(key) or empty for product in batch]
+    return column
+
+
+# Per-field value extractors taking (product, brand_map, custom_domain). Fields
+# not listed here or in HOISTED_FIELD_HANDLERS are read straight off the
+# product by _default_column.
+FieldHandler = Callable[[Dict, Dict[int, str], str | None], object]
+ColumnBuilder = Callable[
+    [List[Dict], Dict[str, List], Dict[int, str], str | None], List
+]
+FIELD_HANDLERS: Dict[str, FieldHandler] = {
+    "brand_name": lambda p, bm, cd: bm.get(p.get("brand_id"), ""),
+    "custom_url": _custom_url_value,
+}
+
+# Fields derived from a nested product attribute, as (attribute, empty container
+# type, extractor). Each attribute is pulled out once per batch and shared by
+# every selected field that reads it, e.g. primary_image_url and thumbnail_url.
+HOISTED_FIELD_HANDLERS: Dict[str, Tuple[str, type, Callable]] = {
+    "primary_image_url": (
+        "primary_image",
+        dict,
+        lambda image: image.get("url_standard", ""),
+    ),
+    "thumbnail_url": (
+        "primary_image",
+        dict,
+        lambda image: image.get("url_thumbnail", ""),
+    ),
+    "image_urls": (
+        "images",
+        list,
+        lambda images: ", ".join(
+            (img or {}).get("url_standard", "") for img in images if img is not None
+        ),
+    ),
+    "category_ids": (
+        "categories",
+        list,
+        lambda categories: ", ".join(str(cat_id) for cat_id in categories),
+    ),
+    "custom_fields": ("custom_fields", list, _custom_fields_value),
+    "variant_skus": (
+        "variants",
+        list,
+        lambda variants: ", ".join(
+            variant.get("sku", "") for variant in variants if variant
+        ),
+    ),
+    "variant_prices": (
+        "variants",
+        list,
+        lambda variants: ", ".join(
+            str(variant.get("price", "")) for variant in variants if variant
+        ),
+    ),
+    "variants": ("variants", list, lambda variants: orjson.dumps(variants).decode()),
+}
+
+
+def _column_builder(field: str) -> ColumnBuilder:
+    """Return a callable producing the field's values for a whole batch."""
+    if field in HOISTED_FIELD_HANDLERS:
+        key, empty_factory, extract = HOISTED_FIELD_HANDLERS[field]
+        return lambda batch, shared, brand_map, custom_domain: [
+            extract(value)
+            for value in _hoisted_column(batch, shared, key, empty_factory)
+        ]
+    handler = FIELD_HANDLERS.get(field)
+    if handler is None:
+        return partial(_default_column, field)
+    return lambda batch, shared, brand_map, custom_domain: [
+        handler(product, brand_map, custom_domain) for product in batch
+    ]
+
+
+@lru_cache(maxsize=256)
+def _headers_for(fields: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Display labels for a field selection, cached per unique selection.
+
+    Returned as a tuple so callers can't mutate the shared cached value.
+    """
+    return tuple(FIELD_OPTIONS.get(field, field) for field in fields)
+
+
+def iter_row_batches(
+    products: Iterable[Dict],
+    fields: Sequence[str],
+    brand_map: Dict[int, str],
+    custom_domain: str = "",
+) -> Iterator[List[Tuple]]:
+    """Yield lists of row tuples for the given products and field order.
+
+    Products are processed CSV_BATCH_SIZE at a time: each selected field is
+    extracted as a column over the batch, then the columns are zipped back into
+    rows.
+    """
+    # The field list is fixed for the whole export, so resolve builders once.
+    # Keyed by field so a field selected twice is only extracted once per batch.
+    builders = {field: _column_builder(field) for field in fields}
+    # Strip the domain once per export rather than for every custom_url value.
+    # An empty input means no domain at all, which _apply_domain sees as None.
+    domain = custom_domain.rstrip("/") if custom_domain else None
+    for batch in _batched(products, CSV_BATCH_SIZE):
+        batch = [product or {} for product in batch]
+        # Nested attributes hoisted for this batch, shared across builders.
+        shared: Dict[str, List] = {}
+        columns = {
+            field: build(batch, shared, brand_map, domain)
+            for field, build in builders.items()
+        }
+        yield list(zip(*(columns[field] for field in fields)))
+
+
+def iter_csv_rows(
+    products: Iterable[Dict],
+    fields: Sequence[str],
+    brand_map: Dict[int, str],
+    custom_domain: str = "",
+) -> Iterator[str]:
+    """Yield encoded CSV text (header first) for the given products and field order."""
+    sink = _LineSink()
+    writer = csv.writer(sink)
+    writer.writerow(_headers_for(tuple(fields)))
+    for rows in iter_row_batches(products, fields, brand_map, custom_domain):
+        # One writerows call per batch keeps the row loop in C.
+        writer.writerows(rows)
+        yield sink.drain()
+    if sink.lines:
+        yield sink.drain()
+
+
+def preview_rows_for(
     products: Sequence[Dict],
     fields: Sequence[str],
     brand_map: Dict[int, str],
     custom_domain: str = "",
-) -> str:
-    """Build CSV content for the given products and field order."""
-    def apply_domain(domain: str, url_value: str) -> str:
-        if not domain:
-            return url_value
-        if not url_value:
-            return ""
-        if url_value.startswith("http://") or url_value.startswith("https://"):
-            return url_value
-        domain_clean = domain.rstrip("/")
-        path = url_value if url_value.startswith("/") else f"/{url_value}"
-        return f"{domain_clean}{path}"
-
-    buffer = io.StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([FIELD_OPTIONS.get(field, field) for field in fields])
-
-    for product in products:
-        product = product or {}
-        row = []
-        for field in fields:
-            primary_image = product.get("primary_image") or {}
-            if field == "primary_image_url":
-                value = primary_image.get("url_standard", "")
-            elif field == "thumbnail_url":
-                value = primary_image.get("url_thumbnail", "")
-            elif field == "image_urls":
-                images = product.get("images") or []
-                value = ", ".join((img or {}).get("url_standard", "") for img in images if img is not None)
-            elif field == "brand_name":
-                brand_id = product.get("brand_id")
-                value = brand_map.get(brand_id, "")
-            elif field == "category_ids":
-                categories = product.get("categories") or []
-                value = ", ".join(str(cat_id) for cat_id in categories)
-            elif field == "custom_fields":
-                custom_fields = product.get("custom_fields") or []
-                parts = []
-                for cf in custom_fields:
-                    name = cf.get("name", "")
-                    cf_value = cf.get("value", "")
-                    parts.append(f"{name}: {cf_value}" if name else cf_value)
-                value = "; ".join(parts)
-            elif field == "variant_skus":
-                variants = product.get("variants") or []
-                value = ", ".join(variant.get("sku", "") for variant in variants if variant)
-            elif field == "variant_prices":
-                variants = product.get("variants") or []
-                value = ", ".join(
-                    str(variant.get("price", "")) for variant in variants if variant
-                )
-            elif field == "variants":
-                variants = product.get("variants") or []
-                value = str(variants)
-            elif field == "custom_url":
-                custom = product.get("custom_url") or {}
-                raw_url = ""
-                if isinstance(custom, dict):
-                    raw_url = custom.get("url", "") or custom.get("path", "") or ""
-                else:
-                    raw_url = str(custom)
-                value = apply_domain(custom_domain, raw_url)
-            else:
-                value = product.get(field, "")
-            if isinstance(value, list):
-                value = ", ".join(str(item) for item in value)
-            elif isinstance(value, dict):
-                value = value.get("url", "") if field == "custom_url" else str(value)
-            row.append(value)
-        writer.writerow(row)
-
-    return buffer.getvalue()
+    limit: int = PREVIEW_ROW_LIMIT,
+) -> List[List[str]]:
+    """Header plus the first rows of the export as cell strings, without CSV encoding."""
+    preview = [list(_headers_for(tuple(fields)))]
+    for rows in iter_row_batches(products[:limit], fields, brand_map, custom_domain):
+        # Render cells the way csv.writer would: None is empty, the rest str().
+        preview.extend(
+            ["" if value is None else str(value) for value in row] for row in rows
+        )
+    return preview
 
 
 @app.route("/", methods=["GET"])
@@ -369,6 +796,7 @@ def index():
     )
 
 
+@lru_cache(maxsize=1)
 def _firestore_client():
     try:
         return firestore.client()
@@ -464,23 +892,21 @@ def export():
         creds_override = session["bc_credentials"]
 
     products = fetch_products(
-        include_variants=include_variants, config_override=creds_override
-    )
-    products = filter_products(
-        products,
+        include_variants=include_variants,
+        config_override=creds_override,
         include_unavailable=include_unavailable,
         include_hidden=include_hidden,
+        fields=fields,
     )
     brand_map = fetch_brand_map(config_override=creds_override)
-    csv_content = build_csv_rows(
+    preview_rows = preview_rows_for(
         products, fields, brand_map, custom_domain=custom_domain
     )
-    preview_rows = list(csv.reader(io.StringIO(csv_content)))
     field_query = ",".join(fields)
 
     return render_template(
         "export.html",
-        csv_content=csv_content,
+        row_count=len(products),
         fields=field_query,
         include_variants=int(include_variants),
         include_unavailable=int(include_unavailable),
@@ -518,20 +944,25 @@ def download():
         creds_override = session["bc_credentials"]
 
     products = fetch_products(
-        include_variants=include_variants, config_override=creds_override
-    )
-    products = filter_products(
-        products,
+        include_variants=include_variants,
+        config_override=creds_override,
         include_unavailable=include_unavailable,
         include_hidden=include_hidden,
+        fields=fields,
     )
     brand_map = fetch_brand_map(config_override=creds_override)
-    csv_content = build_csv_rows(
-        products, fields, brand_map, custom_domain=custom_domain
+    body = _buffered(
+        iter_csv_rows(products, fields, brand_map, custom_domain=custom_domain)
     )
-    response = Response(csv_content, mimetype="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=products.csv"
-    return response
+    headers = {
+        "Content-Disposition": "attachment; filename=products.csv",
+        "Vary": "Accept-Encoding",
+    }
+    # Accept.__contains__ ignores q-values, so "gzip;q=0" must be checked by quality.
+    if request.accept_encodings["gzip"] > 0:
+        body = _gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="text/csv", headers=headers)
 
 
 @app.route("/logout", methods=["POST"])